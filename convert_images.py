@@ -1,59 +1,185 @@
 import os
 from pathlib import Path
 import concurrent.futures
+from itertools import repeat
+import struct
+import sys
+import threading
 import time
+import zlib
 from tqdm import tqdm
-from PIL import Image
-from pillow_heif import register_heif_opener
-from wand.image import Image as WandImage
-from wand.color import Color
+import numpy as np
 
-# Registra o suporte a HEIF/HEIC no Pillow
-register_heif_opener()
+# Os backends de decodificação e codificação (pillow-heif, rawpy e imagecodecs)
+# são importados sob demanda, para que uma conversão HEIC não carregue a libraw
+# e vice-versa
 
-def convert_heic_to_png(input_path, output_path):
+def _decode_heic(input_path):
     """
-    Converte um arquivo HEIC para PNG usando Pillow.
+    Decodifica um arquivo HEIC com a libheif.
+    
+    Args:
+        input_path (str): Caminho do arquivo HEIC
+    
+    Returns:
+        tuple: (numpy.ndarray com os pixels em 8 bits, perfil ICC ou None)
+    """
+    from pillow_heif import open_heif
+    
+    # Fotos HDR (10/12 bits) são reduzidas a 8 bits já na decodificação, pois o
+    # PNG gerado é de 8 bits e o restante do pipeline assume uint8
+    heif = open_heif(input_path, convert_hdr_to_8bit=True)
+    width, height = heif.size
+    channels = len(heif.mode)
+    # Visão sobre o buffer da libheif, descartando o preenchimento de cada linha
+    pixels = np.frombuffer(heif.data, dtype=np.uint8).reshape(height, heif.stride)
+    pixels = pixels[:, :width * channels].reshape(height, width, channels)
+    return pixels, heif.info.get('icc_profile')
+
+def _png_chunk(chunk_type, data):
+    """
+    Monta um chunk PNG (tamanho, tipo, dados e CRC).
+    """
+    return (struct.pack('>I', len(data)) + chunk_type + data
+            + struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+def _encode_png(output_path, pixels, compress_level, icc_profile=None):
+    """
+    Codifica e salva uma imagem como PNG usando o imagecodecs (libpng).
+    
+    Args:
+        output_path (str): Caminho para salvar o arquivo PNG
+        pixels (numpy.ndarray): Pixels da imagem (altura x largura x canais)
+        compress_level (int): Nível de compressão zlib do PNG (0-9)
+        icc_profile (bytes): Perfil de cor ICC a ser embutido, se houver
+    """
+    import imagecodecs
+    
+    # PNG é sem perdas: o nível de compressão só afeta tamanho e tempo
+    png = imagecodecs.png_encode(np.ascontiguousarray(pixels), level=compress_level)
+    
+    if icc_profile:
+        # O chunk iCCP deve vir logo após o IHDR (assinatura de 8 bytes + IHDR de 25 bytes)
+        iccp = _png_chunk(b'iCCP', b'ICC Profile\x00\x00' + zlib.compress(icc_profile))
+        png = png[:33] + iccp + png[33:]
+    
+    # Grava em um arquivo temporário e só então o move para o destino, para que
+    # uma escrita interrompida não deixe um PNG truncado (que seria ignorado
+    # nas próximas execuções por ser mais recente que o original)
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def convert_heic_to_png(input_path, output_path, compress_level=1):
+    """
+    Converte um arquivo HEIC para PNG usando pillow-heif (libheif) e imagecodecs.
     
     Args:
         input_path (str): Caminho do arquivo HEIC
         output_path (str): Caminho para salvar o arquivo PNG
+        compress_level (int): Nível de compressão zlib do PNG (0-9)
+    
+    Returns:
+        tuple: (True, None) em caso de sucesso ou (False, mensagem de erro)
     """
     try:
-        with Image.open(input_path) as img:
-            # Preserva a qualidade máxima na conversão
-            img.save(output_path, 'PNG', optimize=True)
-        return True
+        pixels, icc_profile = _decode_heic(input_path)
+        _encode_png(output_path, pixels, compress_level, icc_profile)
+        return True, None
     except Exception as e:
-        print(f"Erro ao converter {input_path}: {str(e)}")
-        return False
+        return False, f"Erro ao converter {input_path}: {str(e)}"
 
-def convert_cr2_to_png(input_path, output_path):
+# Contexto da libraw por thread, reaproveitado entre arquivos. Isso evita apenas
+# construir um novo objeto LibRaw a cada conversão: os buffers de cada imagem
+# continuam sendo liberados pelo close() (recycle) ao fim de cada arquivo
+_libraw = threading.local()
+
+def _get_libraw():
+    """
+    Retorna o contexto rawpy da thread atual, criando-o no primeiro uso.
+    """
+    raw = getattr(_libraw, 'raw', None)
+    if raw is None:
+        import rawpy
+        raw = _libraw.raw = rawpy.RawPy()
+    return raw
+
+def convert_cr2_to_png(input_path, output_path, compress_level=1):
     """
-    Converte um arquivo CR2 para PNG usando Wand/ImageMagick.
+    Converte um arquivo CR2 para PNG usando rawpy (libraw) e imagecodecs.
     
     Args:
         input_path (str): Caminho do arquivo CR2
         output_path (str): Caminho para salvar o arquivo PNG
+        compress_level (int): Nível de compressão zlib do PNG (0-9)
+    
+    Returns:
+        tuple: (True, None) em caso de sucesso ou (False, mensagem de erro)
     """
     try:
-        with WandImage(filename=input_path) as img:
-            # Ajusta os parâmetros da imagem
-            img.format = 'png'
-            img.compression_quality = 90
-            
-            # Remove canal alpha se existir
-            if img.alpha_channel:
-                img.alpha_channel = 'remove'
-            
-            # Salva como PNG
-            img.save(filename=output_path)
-        return True
+        raw = _get_libraw()
+        try:
+            raw.open_file(input_path)
+            raw.unpack()
+            # Revela o RAW com o balanço de branco da câmera em 8 bits por canal
+            rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=True, output_bps=8)
+        finally:
+            # Libera os dados do arquivo atual, mantendo o contexto para o próximo
+            raw.close()
+        
+        # A saída da libraw é RGB, sem canal alpha
+        _encode_png(output_path, rgb, compress_level)
+        return True, None
     except Exception as e:
-        print(f"Erro ao converter {input_path}: {str(e)}")
-        return False
+        return False, f"Erro ao converter {input_path}: {str(e)}"
+
+def _prefetch(paths, window):
+    """
+    Pede ao kernel a leitura antecipada dos arquivos de entrada, para que o
+    decodificador encontre os dados já no cache de páginas.
+    
+    Args:
+        paths (list): Caminhos dos arquivos, na ordem em que serão convertidos
+        window (threading.Semaphore): Limita quantos arquivos são lidos à frente
+            das conversões concluídas
+    """
+    for path in paths:
+        window.acquire()
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
 
-def process_directory(input_dir, output_dir, conversion_type, max_workers=4):
+def available_cpus():
+    """
+    Retorna quantos núcleos este processo pode usar.
+    
+    No Windows o ProcessPoolExecutor aceita no máximo 61 processos, então o
+    valor é limitado a esse teto.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    if sys.platform == 'win32':
+        cpus = min(cpus, 61)
+    return cpus
+
+def process_directory(input_dir, output_dir, conversion_type, max_workers=4, compress_level=1):
     """
     Processa todos os arquivos HEIC ou CR2 em um diretório.
     
@@ -61,18 +187,22 @@ def process_directory(input_dir, output_dir, conversion_type, max_workers=4):
         input_dir (str): Diretório com os arquivos HEIC ou CR2
         output_dir (str): Diretório para salvar os arquivos PNG
         conversion_type (str): Tipo de conversão ('HEIC' ou 'CR2')
-        max_workers (int): Número máximo de threads para processamento paralelo
+        max_workers (int): Número máximo de processos para processamento paralelo
+            (None usa todos os núcleos disponíveis)
+        compress_level (int): Nível de compressão zlib dos PNGs (0-9)
     """
     # Cria o diretório de saída se não existir
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
     # Define as extensões de arquivo com base no tipo de conversão
-    extensions = ['.heic', '.HEIC', '.heif', '.HEIF'] if conversion_type == 'HEIC' else ['.cr2', '.CR2']
+    extensions = {'heic', 'heif'} if conversion_type == 'HEIC' else {'cr2'}
     
-    # Lista todos os arquivos com as extensões especificadas
-    files = []
-    for ext in extensions:
-        files.extend(list(Path(input_dir).glob(f'**/*{ext}')))
+    # Lista todos os arquivos com as extensões especificadas em uma única
+    # varredura da árvore (sem diferenciar maiúsculas e minúsculas)
+    files = [Path(root) / name
+             for root, _, names in os.walk(input_dir)
+             for name in names
+             if os.path.splitext(name)[1][1:].lower() in extensions]
     
     if not files:
         print(f"Nenhum arquivo {conversion_type} encontrado!")
@@ -82,39 +212,82 @@ def process_directory(input_dir, output_dir, conversion_type, max_workers=4):
     
     # Prepara as tarefas de conversão
     conversion_tasks = []
+    created_dirs = set()
+    skipped = 0
     for file_path in files:
         # Mantém a estrutura de diretórios relativa
         relative_path = file_path.relative_to(input_dir)
         output_path = Path(output_dir) / relative_path.with_suffix('.png')
         
-        # Cria os subdiretórios necessários
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Ignora arquivos cujo PNG já existe e é mais recente que o original
+        # (stat levanta OSError quando o PNG ainda não existe)
+        try:
+            if output_path.stat().st_mtime >= file_path.stat().st_mtime:
+                skipped += 1
+                continue
+        except OSError:
+            pass
+        
+        # Cria os subdiretórios necessários (uma única vez por diretório)
+        parent = output_path.parent
+        if parent not in created_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(parent)
         
         conversion_tasks.append((str(file_path), str(output_path)))
     
+    if not conversion_tasks:
+        print(f"Nenhum arquivo a converter. Ignoradas (já convertidas): {skipped}")
+        return
+    
     # Define a função de conversão com base no tipo de conversão
     conversion_func = convert_heic_to_png if conversion_type == 'HEIC' else convert_cr2_to_png
     
     # Processa as conversões em paralelo com barra de progresso
     successful = 0
-    failed = 0
+    errors = []
+    
+    # Resolve o número de processos uma única vez (None usa todos os núcleos disponíveis)
+    workers = max_workers or available_cpus()
+    chunksize = 8
+    prefetch_window = None
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(conversion_func, input_path, output_path): (input_path, output_path) 
-                  for input_path, output_path in conversion_tasks}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Envia as tarefas em lotes para amortizar a comunicação entre processos
+        results = executor.map(conversion_func,
+                               (input_path for input_path, _ in conversion_tasks),
+                               (output_path for _, output_path in conversion_tasks),
+                               repeat(compress_level),
+                               chunksize=chunksize)
         
-        with tqdm(total=len(conversion_tasks), desc="Convertendo imagens") as pbar:
-            for future in concurrent.futures.as_completed(futures):
-                success = future.result()
-                if success:
-                    successful += 1
-                else:
-                    failed += 1
-                pbar.update(1)
+        # Lê antecipadamente os próximos arquivos (somente em sistemas com posix_fadvise).
+        # A janela cobre os lotes em processamento e mais dois arquivos por processo.
+        # A thread só é iniciada depois que o map já criou os processos do pool.
+        if hasattr(os, 'posix_fadvise'):
+            prefetch_window = threading.Semaphore(workers * (chunksize + 2))
+            threading.Thread(target=_prefetch,
+                             args=([input_path for input_path, _ in conversion_tasks], prefetch_window),
+                             daemon=True).start()
+        
+        # Atualiza a barra no máximo a cada 0,5 s ou 0,5% das tarefas
+        progress = tqdm(results, total=len(conversion_tasks), desc="Convertendo imagens",
+                        mininterval=0.5, miniters=max(1, len(conversion_tasks) // 200), smoothing=0)
+        for success, error in progress:
+            if prefetch_window is not None:
+                prefetch_window.release()
+            if success:
+                successful += 1
+            else:
+                errors.append(error)
+    
+    # Exibe os erros só no final para não disputar o stdout com a barra de progresso
+    for error in errors:
+        print(error)
     
     print(f"\nConversão concluída!")
     print(f"Convertidas com sucesso: {successful}")
-    print(f"Falhas na conversão: {failed}")
+    print(f"Falhas na conversão: {len(errors)}")
+    print(f"Ignoradas (já convertidas): {skipped}")
 
 if __name__ == "__main__":
     # Solicita o tipo de conversão
@@ -147,7 +320,7 @@ if __name__ == "__main__":
     
     if confirmation.upper() == 'S':
         # Configurações
-        MAX_WORKERS = 16  # Número de threads para processamento paralelo
+        MAX_WORKERS = available_cpus()  # Um processo por núcleo disponível
         
         # Registra o tempo de início
         start_time = time.time()